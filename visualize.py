@@ -6,63 +6,323 @@ from matplotlib.widgets import RangeSlider, RectangleSelector, RadioButtons
 
 import os
 import argparse
+import bisect
+import ctypes
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Constants ---
 INITIAL_WINDOW_SEC = 3600.0
 BYTES_PER_SAMPLE = 4
 # MAX_WIDTH_SEC removed, utilizing self.max_samples instead
-MAX_PLOT_POINTS = 5000   # Maximum points to plot per line
+MAX_PLOT_POINTS = 5000   # Points per line until we know the axes' width
+MIN_PLOT_POINTS = 256    # ... and the least we'll plot however narrow it is
+YLIM_HYSTERESIS = 0.05   # Ignore auto Y-limit changes smaller than this
+WIDE_VIEW_SEC = 10.0     # Wider views scale Y to the whole-file peak
+PYRAMID_FIRST_LEVEL = 4  # Finest stored min/max level (2**4 samples per bucket)
+PYRAMID_MAGIC = 0x31525950  # "PYR1", start of a cached .pyr pyramid file
+PREFETCH_MAX_BYTES = 512 << 20  # Read whole files up to this size ahead on open
+READ_BLOCK_SAMPLES = 1 << 20    # Samples per read while building a pyramid
+
+# Optional compiled min/max kernel (see wavekernel.c, "make wavekernel.so")
+try:
+    _kernel = ctypes.CDLL(os.path.join(os.path.dirname(os.path.abspath(__file__)), "wavekernel.so"))
+    _i32_array = np.ctypeslib.ndpointer(dtype=np.int32, flags='C_CONTIGUOUS')
+    _i16_array = np.ctypeslib.ndpointer(dtype=np.int16, flags='C_CONTIGUOUS')
+    _f64_array = np.ctypeslib.ndpointer(dtype=np.float64, flags='C_CONTIGUOUS')
+    _kernel.bucket_minmax_i32.restype = ctypes.c_size_t
+    _kernel.bucket_minmax_i32.argtypes = [_i32_array, ctypes.c_size_t, ctypes.c_size_t, _i32_array, _i32_array]
+    _kernel.bucket_minmax_top16.restype = ctypes.c_size_t
+    _kernel.bucket_minmax_top16.argtypes = [_i32_array, ctypes.c_size_t, ctypes.c_size_t, _i16_array, _i16_array]
+    _kernel.scan_i32.restype = None
+    _kernel.scan_i32.argtypes = [_i32_array, ctypes.c_size_t, _f64_array, _i32_array]
+except (OSError, AttributeError):
+    # Not built (or built from an older wavekernel.c)
+    _kernel = None
+
+# posix_fadvise() hints, where the platform has them
+FADV_NORMAL = getattr(os, 'POSIX_FADV_NORMAL', None)
+FADV_SEQUENTIAL = getattr(os, 'POSIX_FADV_SEQUENTIAL', None)
+FADV_WILLNEED = getattr(os, 'POSIX_FADV_WILLNEED', None)
+
+# Shared empty data for lines that have nothing to show
+_EMPTY = np.empty(0, dtype=np.float64)
+
+# Y tick formatters, one per Y mode so no tick has to check which mode we're in
+def _eng_fmt(x, suffix, milli):
+    # Do "Engineering mode" by hand
+    if x == 0:
+        return "0"+suffix
+    if abs(x) < 0.1:
+        return f"{x*1000:.2f}"+milli
+    return f"{x:.2f}"+suffix
+
+def _y_fmt_raw(x, pos):
+    return f"{int(x) & 0xFFFFFFFF:09_X}"
+
+def _y_fmt_scaled(x, pos):
+    return _eng_fmt(x / 2147483648, "", "ᴇ-3")
+
+def _y_fmt_volt(x, pos):
+    # Assuming 1Vrms full-range signal
+    return _eng_fmt(x / 2147483648 * 1.4142, "V", "mV")
+
+Y_FORMATTERS = {'Raw': _y_fmt_raw, 'Scaled': _y_fmt_scaled, 'Volt': _y_fmt_volt}
+
+def bucket_minmax(chunk, bucket, out_min, out_max):
+    """Per-bucket min/max of an int32 chunk in one pass. Returns the bucket count."""
+    if _kernel is not None:
+        return _kernel.bucket_minmax_i32(chunk, chunk.size, bucket, out_min, out_max)
+
+    # numpy fallback: full buckets as a 2D view, then the partial tail
+    full = chunk.size // bucket
+    buckets = chunk[:full * bucket].reshape(full, bucket)
+    np.min(buckets, axis=1, out=out_min[:full])
+    np.max(buckets, axis=1, out=out_max[:full])
+    if full * bucket == chunk.size:
+        return full
+    tail = chunk[full * bucket:]
+    out_min[full] = tail.min()
+    out_max[full] = tail.max()
+    return full + 1
+
+def bucket_minmax_top16(chunk, bucket, out_min, out_max):
+    """bucket_minmax(), keeping only the top 16 bits as int16 like the pyramid does."""
+    if _kernel is not None:
+        return _kernel.bucket_minmax_top16(chunk, chunk.size, bucket, out_min, out_max)
+
+    # numpy fallback: via chunk-sized int32 temporaries
+    buckets = -(-chunk.size // bucket)
+    lo = np.empty(buckets, dtype=np.int32)
+    hi = np.empty(buckets, dtype=np.int32)
+    bucket_minmax(chunk, bucket, lo, hi)
+    np.right_shift(lo, 16, out=out_min[:buckets], casting='unsafe')
+    np.right_shift(hi, 16, out=out_max[:buckets], casting='unsafe')
+    return buckets
+
+def read_samples(fd, start_sample, end_sample, out):
+    """pread() samples [start_sample, end_sample) of an int32 file into out.
+
+    Returns the part of out that was filled. Nothing stays mapped, so
+    panning through a huge file doesn't grow our page tables or RSS; the
+    page cache does the caching.
+    """
+    chunk = out[:end_sample - start_sample]
+    nbytes = os.preadv(fd, [chunk], start_sample * BYTES_PER_SAMPLE)
+    return chunk[:nbytes // BYTES_PER_SAMPLE]
+
+def advise(fd, advice, start_sample=0, end_sample=None):
+    """posix_fadvise() samples [start_sample, end_sample) of a file (None: to the end)."""
+    if advice is None:
+        return
+    start = max(0, start_sample)
+    length = 0 if end_sample is None else end_sample - start
+    if end_sample is None or length > 0:
+        os.posix_fadvise(fd, start * BYTES_PER_SAMPLE, length * BYTES_PER_SAMPLE, advice)
+
+def scan(chunk, out, extremes):
+    """Copy an int32 chunk into a float64 buffer, and its (min, max) into extremes."""
+    if _kernel is not None:
+        _kernel.scan_i32(chunk, chunk.size, out, extremes)
+        return
+
+    np.copyto(out, chunk)
+    extremes[0] = chunk.min()
+    extremes[1] = chunk.max()
+
+def halve_level(lo, hi):
+    """Next (coarser) pyramid level: min/max of neighbouring bucket pairs."""
+    # Elementwise min/max of the even and odd buckets is a plain binary
+    # ufunc loop that numpy runs with SIMD, unlike a reduction over pairs
+    pairs = lo.size // 2
+    next_lo = np.empty(lo.size - pairs, dtype=lo.dtype)
+    next_hi = np.empty(hi.size - pairs, dtype=hi.dtype)
+    np.minimum(lo[0:2 * pairs:2], lo[1::2], out=next_lo[:pairs])
+    np.maximum(hi[0:2 * pairs:2], hi[1::2], out=next_hi[:pairs])
+    if lo.size & 1:
+        # Odd bucket out at the end becomes a bucket of its own
+        next_lo[-1] = lo[-1]
+        next_hi[-1] = hi[-1]
+    return next_lo, next_hi
+
+def build_pyramid(fd, samples):
+    """Min/max decimation pyramid (mipmap) for one file.
+
+    Level k covers 2**(PYRAMID_FIRST_LEVEL + k) samples per bucket, and stores
+    the bucket minimum and maximum as int16 (top 16 bits of the sample) since
+    nobody can see the low bits when zoomed out that far.  Levels stop once
+    the whole file fits in the smallest plot we'd draw.
+
+    The file is streamed through one READ_BLOCK_SAMPLES buffer, straight
+    into the int16 first level.
+    """
+    buckets = -(-samples >> PYRAMID_FIRST_LEVEL)
+    lo = np.empty(buckets, dtype=np.int16)
+    hi = np.empty(buckets, dtype=np.int16)
+    block = np.empty(READ_BLOCK_SAMPLES, dtype=np.int32)
+    done = 0
+    for start in range(0, samples, READ_BLOCK_SAMPLES):
+        chunk = read_samples(fd, start, min(start + READ_BLOCK_SAMPLES, samples), block)
+        done += bucket_minmax_top16(chunk, 1 << PYRAMID_FIRST_LEVEL, lo[done:], hi[done:])
+
+    levels = [(lo, hi)]
+    while lo.size > MIN_PLOT_POINTS // 2:
+        lo, hi = halve_level(lo, hi)
+        levels.append((lo, hi))
+    return levels
+
+def load_pyramid(path, samples):
+    """Map the cached pyramid for path from path + '.pyr'.
+
+    The file is a four-entry int64 header (magic, samples, first level,
+    number of levels) followed by each level's min and max arrays as int16.
+    Returns None if there's no usable cache.
+    """
+    cache = path + '.pyr'
+    try:
+        if os.path.getmtime(cache) < os.path.getmtime(path):
+            return None
+        header = np.fromfile(cache, dtype=np.int64, count=4)
+        if len(header) != 4 or list(header[:3]) != [PYRAMID_MAGIC, samples, PYRAMID_FIRST_LEVEL]:
+            return None
+        data = np.memmap(cache, dtype=np.int16, mode='r', offset=header.nbytes)
+    except (OSError, ValueError):
+        return None
+
+    # Level sizes follow from the sample count, same as in build_pyramid().
+    # Each level halves the one before, which bounds the level count, so a
+    # damaged header can't keep us in the loop.
+    levels = []
+    pos, size = 0, -(-samples >> PYRAMID_FIRST_LEVEL)
+    if not 0 < header[3] <= size.bit_length() + 1:
+        return None
+    for _ in range(header[3]):
+        if pos + 2 * size > data.size:
+            return None
+        levels.append((data[pos:pos + size], data[pos + size:pos + 2 * size]))
+        pos += 2 * size
+        size -= size // 2
+    if pos != data.size:
+        return None
+    return levels
+
+def save_pyramid(path, samples, levels):
+    """Write the pyramid to path + '.pyr' for next time. Best effort only."""
+    cache = path + '.pyr'
+    tmp = cache + '.tmp'
+    header = np.array([PYRAMID_MAGIC, samples, PYRAMID_FIRST_LEVEL, len(levels)], dtype=np.int64)
+    try:
+        with open(tmp, 'wb') as f:
+            header.tofile(f)
+            for lo, hi in levels:
+                lo.tofile(f)
+                hi.tofile(f)
+        os.replace(tmp, cache)
+    except OSError as e:
+        print(f"Not caching pyramid for {path}: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
 class WaveformVisualizer:
     def __init__(self, filenames, rate, min_zoom_samples=100):
         self.rate = rate
         self.navigating = False
+        # Set once the user picks a Y range by hand (rectangle zoom)
+        self._y_locked = False
         self.filenames = filenames
         self.min_zoom_samples = min_zoom_samples
 
         # X-Axis Mode
         self.x_mode = 'Time'
 
-        self.mapped_files = []
+        self.files = []          # (path, samples, name)
+        self.fds = []            # File descriptor per file
+        self.pyramids = []       # Min/max pyramid per file, built on first use
+        self.file_abs_max = []   # Whole-file peak, known once the pyramid is
         self.lines = []
         self.max_samples = 0
 
-        # Load files
+        # Open files (the pyramids are built or loaded lazily). Read the
+        # first sample right away, so directories and the like get
+        # rejected here rather than in the middle of a redraw.
         for f in filenames:
+            fd = None
             try:
-                fsize = os.path.getsize(f)
-                samples = fsize // BYTES_PER_SAMPLE
-                mm = np.memmap(f, dtype=np.int32, mode='r', shape=(samples,))
-                self.mapped_files.append((mm, os.path.basename(f)))
+                fd = os.open(f, os.O_RDONLY)
+                samples = os.fstat(fd).st_size // BYTES_PER_SAMPLE
+                if not samples:
+                    raise ValueError("empty file")
+                os.pread(fd, BYTES_PER_SAMPLE, 0)
+                self.files.append((f, samples, os.path.basename(f)))
+                self.fds.append(fd)
+                self.pyramids.append(None)
+                self.file_abs_max.append(None)
                 self.max_samples = max(self.max_samples, samples)
             except Exception as e:
                 print(f"Error opening {f}: {e}")
+                if fd is not None:
+                    os.close(fd)
 
-        if not self.mapped_files:
+        if not self.files:
             return
 
-        # Pre-allocate X-axis buffer to avoid allocations during plot updates
-
-        self.t_buffer = np.zeros(MAX_PLOT_POINTS, dtype=np.float64)
-        # Pre-allocate index buffer 0..N-1
-        self.index_buffer = np.arange(MAX_PLOT_POINTS, dtype=np.float64)
+        # Files sorted by length, so get_chunk can skip the ones that end
+        # before the view starts with a binary search
+        self.by_size = sorted(range(len(self.files)), key=lambda i: self.files[i][1])
+        self.sorted_samples = [self.files[i][1] for i in self.by_size]
+        self.first_shown = 0
+        self.last_start = 0
+        self.loaded_range = None  # (start, end, step) the lines were last loaded with
+        self.pan_forward = True
+
+        # Points to plot per line, and the widest view that still shows
+        # markers on the samples. Both follow the axes' width, see fit_to_width().
+        self.plot_points = MAX_PLOT_POINTS
+        self.marker_max_samples = 300
+        self.alloc_buffers(MAX_PLOT_POINTS)
+        self.scan_extremes = np.empty(2, dtype=np.int32)
+        # Per-file (min, max) of the current view, reduced once per update
+        self.extremes = np.empty((len(self.files), 2), dtype=np.int32)
 
         self.setup_ui()
 
     def setup_ui(self):
+        # Most of the time there's just the one file: skip the per-file
+        # loop and the cross-file reduction entirely
+        if len(self.files) == 1:
+            self.compute_chunk = self.compute_chunk_1file
+
+        # Let Agg merge line segments that land within a pixel of each
+        # other. That's most of a dense waveform.
+        plt.rcParams['path.simplify'] = True
+        plt.rcParams['path.simplify_threshold'] = 1.0
+
         self.fig, self.ax = plt.subplots(figsize=(12, 6))
         # Manual "tight layout" to maximize space but keep room for slider
         plt.subplots_adjust(left=0.08, right=0.95, top=0.95, bottom=0.20)
 
-        # Create line objects
-        for _, name in self.mapped_files:
-            line, = self.ax.plot([], [], linewidth=0.8, label=name)
+        # Create line objects. They're animated, so a normal draw only paints
+        # the axes background and on_draw() adds the lines on top. That way
+        # a data-only update can just blit the lines over a saved background.
+        for _, _, name in self.files:
+            line, = self.ax.plot([], [], linewidth=0.8, markersize=3, label=name, animated=True)
             self.lines.append(line)
+        self.background = None
+        self.background_lims = None
+        # Current marker and antialiasing state per line, so we only touch
+        # them on changes
+        self.marker_on = [False] * len(self.lines)
+        self.antialiased = [True] * len(self.lines)
 
         self.ax.grid(True, which='both', linestyle=':', alpha=0.5)
         self.ax.set_xlabel("Time (s)")
         self.ax.set_ylabel("Amplitude")
-        self.ax.legend(loc='upper right', fontsize='x-small')
+        # The legend is part of the saved background, but the lines get
+        # painted over that, so on_draw() also keeps the legend's pixels
+        # around to put back on top after every blit.
+        self.legend = self.ax.legend(loc='upper right', fontsize='x-small')
+        self.legend_pixels = None
 
         # --- X-Axis Formatter ---
         def x_fmt(x, pos):
@@ -76,25 +336,7 @@ class WaveformVisualizer:
 
         # --- Y-Axis Formatter ---
         self.y_mode = 'Volt'
-        def y_fmt(x, pos):
-            if self.y_mode == 'Raw':
-                val = np.uint32(x)
-                return f"{val:09_X}"
-            # Do "Engineering mode" by hand
-            x = x / 2147483648
-            suffix, milli = "", "ᴇ-3"
-            if self.y_mode == 'Volt':
-                # Assuming 1Vrms full-range signal
-                x = x * 1.4142
-                suffix, milli = "V", "mV"
-            if x == 0:
-                return "0"+suffix
-            if abs(x) < 0.1:
-                x = x*1000
-                suffix = milli
-            return f"{x:.2f}"+suffix
-
-        self.ax.yaxis.set_major_formatter(ticker.FuncFormatter(y_fmt))
+        self.ax.yaxis.set_major_formatter(ticker.FuncFormatter(Y_FORMATTERS[self.y_mode]))
 
         # RangeSlider setup
         ax_slider = plt.axes([0.15, 0.05, 0.50, 0.03])
@@ -179,7 +421,7 @@ class WaveformVisualizer:
 
         def set_y_mode(label):
             self.y_mode = label
-            self.ax.yaxis.set_major_formatter(ticker.FuncFormatter(y_fmt))
+            self.ax.yaxis.set_major_formatter(ticker.FuncFormatter(Y_FORMATTERS[label]))
 
             # Update labels
             if label == 'Raw':
@@ -193,15 +435,38 @@ class WaveformVisualizer:
 
         self.radio.on_clicked(set_y_mode)
 
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+        # Fast wheel flicks, slider drags and key repeats all go through one
+        # single-shot timer, so they collapse into at most one update per frame
+        self.pending = None
+        self.update_timer = self.fig.canvas.new_timer(interval=16)
+        self.update_timer.single_shot = True
+        self.update_timer.add_callback(self.flush_update)
+
+        # Pans load their data on a worker thread, so slow page faults don't
+        # freeze the GUI; a poll timer hands the result back to matplotlib
+        self.loader = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.reload_pending = False
+        self.poll_timer = self.fig.canvas.new_timer(interval=5)
+        self.poll_timer.add_callback(self.poll)
+
+        # Decimate for the actual window size, and again whenever it changes
+        self.fit_to_width()
+        self.fig.canvas.mpl_connect('resize_event', self.on_resize)
+
         # Scroll Zoom setup
         self.fig.canvas.mpl_connect('scroll_event', self.on_scroll)
         self.fig.canvas.mpl_connect('key_press_event', self.on_key)
         self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
 
-        # Custom Rectangle Selector
+        # Custom Rectangle Selector. No blitting: with useblit, it re-renders
+        # the whole figure after every draw just to get a background without
+        # our (animated) lines, and then paints them over the legend.
         self.rs = RectangleSelector(
             self.ax, self.on_select,
-            useblit=True,
+            useblit=False,
             button=[1],  # Left mouse button
             minspanx=5, minspany=5,
             spancoords='pixels',
@@ -229,7 +494,79 @@ class WaveformVisualizer:
 
         plt.show()
 
-    def get_chunk(self, start_sample, window_samples):
+    def load_file(self, i):
+        """Build or load file i's min/max pyramid on first use."""
+        path, samples, _ = self.files[i]
+        fd = self.fds[i]
+        pyramid = load_pyramid(path, samples)
+        if pyramid is None:
+            # One straight pass: let the kernel read ahead aggressively
+            advise(fd, FADV_SEQUENTIAL)
+            pyramid = build_pyramid(fd, samples)
+            advise(fd, FADV_NORMAL)
+            save_pyramid(path, samples, pyramid)
+        self.pyramids[i] = pyramid
+
+        if samples * BYTES_PER_SAMPLE <= PREFETCH_MAX_BYTES:
+            # Short clips most likely get scrolled through entirely
+            advise(fd, FADV_WILLNEED)
+
+        # The coarsest level gives the peak for wide views for free
+        lo, hi = self.pyramids[i][-1]
+        self.file_abs_max[i] = max(-int(lo.min()), int(hi.max())) << 16
+
+    def alloc_buffers(self, points):
+        """Pre-allocate the per-update buffers for up to 'points' points per line."""
+        # X-axis buffer to avoid allocations during plot updates.
+        # All lines in a view share it, see x_axis().
+        self.x_buffer = np.zeros(points + 4, dtype=np.float64)
+        self.x_key = None
+        self.x_count = 0
+        # Pre-allocate index buffer 0..N-1
+        self.index_buffer = np.arange(points, dtype=np.float64)
+        # Per-file min/max buckets for views finer than the pyramid, and the
+        # (step, first bucket, last bucket) they hold, so pans can reuse them
+        self.env_min = [np.empty(points // 2 + 2, dtype=np.int32) for _ in self.files]
+        self.env_max = [np.empty(points // 2 + 2, dtype=np.int32) for _ in self.files]
+        self.env_range = [(0, 0, 0)] * len(self.files)
+        # Per-file Y buffer. It's float64 because that's what Line2D converts
+        # to anyway, so filling it is the only int32->float pass we make.
+        # Pyramid slices can have a partial bucket at either end, hence the +4.
+        self.y_buffers = [np.empty(points + 4, dtype=np.float64) for _ in self.files]
+        # Raw samples read for the view. Reads only go below the pyramid,
+        # so at most a bucket of 2**PYRAMID_FIRST_LEVEL samples per point.
+        self.read_buffer = np.empty((points // 2 + 2) << PYRAMID_FIRST_LEVEL, dtype=np.int32)
+
+    def fit_to_width(self):
+        """Match the decimation to the axes' width in pixels.
+
+        Two points per pixel column (a min/max pair) is all a screen can
+        show, so wide windows get more and small ones less. Returns True
+        if that changed.
+        """
+        px = int(self.ax.bbox.width)
+        plot_points = max(2 * px, MIN_PLOT_POINTS)
+        if plot_points == self.plot_points:
+            return False
+
+        # Pyramids cached before the axes' width counted can top out at
+        # MAX_PLOT_POINTS, so never go below that. A running load is
+        # still using the old buffers.
+        if plot_points > self.index_buffer.size:
+            self.wait_for_load()
+            self.alloc_buffers(plot_points)
+        self.plot_points = plot_points
+        self.marker_max_samples = px // 4
+        self.loaded_range = None
+        return True
+
+    def on_resize(self, event):
+        """Reload at the new decimation when the window size changes."""
+        if self.fit_to_width():
+            self.schedule_update(self.reload)
+
+    def chunk_range(self, start_sample, window_samples):
+        """Turn a requested view into integer (start, end, step)."""
         # start_sample is a float from matplotlib axes often, cast to int
         start_sample = int(start_sample)
         window_samples = int(window_samples)
@@ -239,69 +576,254 @@ class WaveformVisualizer:
 
         end_sample = start_sample + window_samples
 
-        # Determine downsampling step to keep plot fast
-        total_samples = window_samples
-        step = 1
-        if total_samples > MAX_PLOT_POINTS:
-            step = int(np.ceil(total_samples / MAX_PLOT_POINTS))
-
-        global_min_y, global_max_y = 2147483647, -2147483648
+        # Remember which way we're panning, for read-ahead in compute_line
+        if start_sample != self.last_start:
+            self.pan_forward = start_sample > self.last_start
+            self.last_start = start_sample
+
+        step = self.plot_step(window_samples)
+        self.loaded_range = (start_sample, end_sample, step)
+        return start_sample, end_sample, step
+
+    def plot_step(self, window_samples):
+        """Samples per plotted bucket for a view this wide."""
+        # Determine bucket size to keep plot fast. Each bucket is drawn as
+        # a min/max pair, so peaks don't get lost between the samples.
+        if window_samples > self.plot_points:
+            return int(np.ceil(window_samples / (self.plot_points // 2)))
+        return 1
+
+    def is_loaded(self, start_sample, end_sample):
+        """Do the lines already hold this view, at the resolution it would get?"""
+        if self.loaded_range is None:
+            return False
+        loaded_start, loaded_end, loaded_step = self.loaded_range
+        start_sample = max(0, int(start_sample))
+        end_sample = int(end_sample)
+        if start_sample < loaded_start or end_sample > loaded_end:
+            return False
+        step = self.plot_step(end_sample - start_sample)
+        if step != loaded_step:
+            return False
+        if step > 1:
+            return True
+
+        # Zoomed in to single samples: a reload may have to turn on markers
+        for samples in self.sorted_samples:
+            if samples > start_sample and min(end_sample, samples) - start_sample < self.marker_max_samples:
+                return False
+        return True
+
+    def get_chunk(self, start_sample, window_samples, compute_minmax=True):
+        """Load the view into the lines right away. Returns (has_data, min, max)."""
+        self.wait_for_load()
+        has_data, min_y, max_y, updates = self.compute_chunk(start_sample, window_samples, compute_minmax)
+        self.apply_chunk(updates)
+        return has_data, min_y, max_y
+
+    def compute_chunk(self, start_sample, window_samples, compute_minmax=True):
+        """Compute the line data for a view, without touching matplotlib.
+
+        This is what runs on the loader thread. Returns (has_data, min, max,
+        updates), where updates is a list of (line index, x grid, y, marker)
+        for apply_chunk(), with the x grid None for lines to blank.
+        """
+        start_sample, end_sample, step = self.chunk_range(start_sample, window_samples)
+
+        # Files without data in view keep these and drop out of the reduction
+        self.extremes[:, 0] = 2147483647
+        self.extremes[:, 1] = -2147483648
         has_data = False
 
-        for line, (mm, _) in zip(self.lines, self.mapped_files):
-            if start_sample >= mm.size:
-                line.set_data([], [])
-                continue
-
-            # Safe end for this specific file
-            safe_end = min(end_sample, mm.size)
-            if safe_end <= start_sample:
-                 line.set_data([], [])
-                 continue
-
-            # Strided slice (View into memory map - very fast)
-            chunk = mm[start_sample:safe_end:step]
-
-            if chunk.size > 0:
-                # Generate X Axis without allocation using pre-allocated buffer
-                # We use the shared self.t_buffer (now essentially indices)
-
-                current_count = chunk.size
-                if current_count > len(self.t_buffer):
-                    # Should rarely happen with correct step logic, but resize if needed
-                    self.t_buffer = np.zeros(current_count, dtype=np.float64)
+        # Only files longer than start_sample have anything to show.
+        # Blank the ones that did last time but don't any more.
+        first = bisect.bisect_right(self.sorted_samples, start_sample)
+        updates = [(i, None, None, False) for i in self.by_size[self.first_shown:first]]
+        self.first_shown = first
 
-                # In-place generation of sample axis:
-                # 1. Fill with 0..N-1
-                # 2. Scale by step
-                # 3. Add start_sample
-
-                # View into the result buffer
-                target_buffer = self.t_buffer[:current_count]
-
-                # Copy pre-calculated indices 0..N-1
-                np.copyto(target_buffer, self.index_buffer[:current_count])
-
-                # Apply scaling and offset in-place
-                target_buffer *= step
-                target_buffer += start_sample
-
-                line.set_data(target_buffer, chunk)
-
-                # Show markers if zooming in enough (step must be 1 to show true samples)
-                if step == 1 and chunk.size < 300:
-                    line.set_marker('.')
-                    line.set_markersize(3)
-                else:
-                    line.set_marker("")
+        for i in self.by_size[first:]:
+            result = self.compute_line(i, start_sample, end_sample, step, compute_minmax)
+            if result is None:
+                updates.append((i, None, None, False))
+                continue
+            extremes, x_grid, y_data, want_marker = result
+            self.extremes[i] = extremes
+            updates.append((i, x_grid, y_data, want_marker))
+            has_data = True
+
+        global_min_y = int(self.extremes[:, 0].min())
+        global_max_y = int(self.extremes[:, 1].max())
+        return has_data, global_min_y, global_max_y, updates
+
+    def compute_chunk_1file(self, start_sample, window_samples, compute_minmax=True):
+        """compute_chunk for the common single-file case: no loop, no reduction."""
+        start_sample, end_sample, step = self.chunk_range(start_sample, window_samples)
+        result = self.compute_line(0, start_sample, end_sample, step, compute_minmax)
+        if result is None:
+            return False, 2147483647, -2147483648, [(0, None, None, False)]
+        extremes, x_grid, y_data, want_marker = result
+        return True, int(extremes[0]), int(extremes[1]), [(0, x_grid, y_data, want_marker)]
+
+    def apply_chunk(self, updates):
+        """Hand computed line data to matplotlib (GUI thread only)."""
+        for i, x_grid, y_data, want_marker in updates:
+            line = self.lines[i]
+            if x_grid is None:
+                line.set_data(_EMPTY, _EMPTY)
+                continue
 
-                global_min_y = min(global_min_y, np.min(chunk))
-                global_max_y = max(global_max_y, np.max(chunk))
-                has_data = True
+            # set_data() copies, so the shared x buffer is free again after
+            line.set_data(self.x_axis(*x_grid, y_data.size), y_data)
+
+            # Setting the marker invalidates the line's cached path, so only
+            # do it when the state actually changes.
+            if want_marker != self.marker_on[i]:
+                line.set_marker('.' if want_marker else "")
+                self.marker_on[i] = want_marker
+
+            # Min/max envelopes are a solid band of vertical strokes, and
+            # antialiasing them is most of the cost of drawing them
+            want_antialiased = not x_grid[2]
+            if want_antialiased != self.antialiased[i]:
+                line.set_antialiased(want_antialiased)
+                self.antialiased[i] = want_antialiased
+
+    def wait_for_load(self):
+        """Finish any background load first; a synchronous load supersedes it."""
+        if self.future is not None:
+            self.future.result()
+            self.future = None
+            self.reload_pending = False
+
+    def envelope(self, i, fd, step, first_bucket, last_bucket):
+        """Min/max of file i's buckets [first_bucket, last_bucket) into env_min/env_max.
+
+        Buckets already there from the last call (same step) are moved into
+        place, so a pan only reduces the newly exposed samples. Returns the
+        number of buckets.
+        """
+        lo, hi = self.env_min[i], self.env_max[i]
+        old_step, old_first, old_last = self.env_range[i]
+        buckets = last_bucket - first_bucket
+
+        keep_first, keep_last = max(first_bucket, old_first), min(last_bucket, old_last)
+        if step == old_step and keep_first < keep_last:
+            src = slice(keep_first - old_first, keep_last - old_first)
+            dst = slice(keep_first - first_bucket, keep_last - first_bucket)
+            lo[dst] = lo[src]
+            hi[dst] = hi[src]
+        else:
+            keep_first = keep_last = first_bucket
+
+        # Reduce the new buckets on either side of what we kept
+        if first_bucket < keep_first:
+            new = slice(0, keep_first - first_bucket)
+            chunk = read_samples(fd, first_bucket * step, keep_first * step, self.read_buffer)
+            bucket_minmax(chunk, step, lo[new], hi[new])
+        if keep_last < last_bucket:
+            new = slice(keep_last - first_bucket, buckets)
+            chunk = read_samples(fd, keep_last * step, last_bucket * step, self.read_buffer)
+            bucket_minmax(chunk, step, lo[new], hi[new])
+
+        self.env_range[i] = (step, first_bucket, last_bucket)
+        return buckets
+
+    def compute_line(self, i, start_sample, end_sample, step, compute_minmax):
+        """Compute file i's part of the view into its x/y buffers.
+
+        Returns ((min, max), x grid, y, show markers), or None if the file has
+        no data in view. The x grid is the (start, step, pairs) for x_axis().
+        """
+        if self.pyramids[i] is None:
+            self.load_file(i)
+        fd = self.fds[i]
+
+        # Safe end for this specific file
+        safe_end = min(end_sample, self.files[i][1])
+        if safe_end <= start_sample:
+             return None
+
+        extremes = 2147483647, -2147483648
+        if step == 1:
+            chunk = read_samples(fd, start_sample, safe_end, self.read_buffer)
+            current_count = chunk.size
+            y_data = self.y_buffers[i][:current_count]
+            # Convert and min/max in one pass; cheap enough to always do
+            scan(chunk, y_data, self.scan_extremes)
+            extremes = self.scan_extremes
+            x_start, x_step = start_sample, 1
+        elif step < 1 << PYRAMID_FIRST_LEVEL:
+            # Finer than the pyramid: reduce the raw window. Buckets sit on a
+            # fixed grid of 'step' samples so they don't shift when panning.
+            first_bucket = start_sample // step
+            buckets = self.envelope(i, fd, step, first_bucket, -(-safe_end // step))
+            lo, hi = self.env_min[i][:buckets], self.env_max[i][:buckets]
+            current_count = 2 * buckets
+            y_data = self.y_buffers[i][:current_count]
+            y_data[0::2] = lo
+            y_data[1::2] = hi
+            if compute_minmax:
+                extremes = np.min(lo), np.max(hi)
+            x_start, x_step = first_bucket * step, step
+        else:
+            # Pick the pyramid level with at least 'step' samples per bucket
+            pyramid = self.pyramids[i]
+            level = min((step - 1).bit_length(), PYRAMID_FIRST_LEVEL + len(pyramid) - 1)
+            lo, hi = pyramid[level - PYRAMID_FIRST_LEVEL]
+            first_bucket = start_sample >> level
+            last_bucket = (safe_end + (1 << level) - 1) >> level
+            lo, hi = lo[first_bucket:last_bucket], hi[first_bucket:last_bucket]
+
+            buckets = lo.size
+            current_count = 2 * buckets
+            y_data = self.y_buffers[i][:current_count]
+            # Convert and scale back to int32 units in one pass
+            np.multiply(lo, 65536.0, out=y_data[0::2])
+            np.multiply(hi, 65536.0, out=y_data[1::2])
+            if compute_minmax:
+                extremes = int(lo.min()) << 16, int(hi.max()) << 16
+            x_start, x_step = first_bucket << level, 1 << level
+
+        if step < 1 << PYRAMID_FIRST_LEVEL:
+            # The next pan most likely goes the same way: have the kernel
+            # start reading that window while we draw this one
+            width = end_sample - start_sample
+            if self.pan_forward:
+                advise(fd, FADV_WILLNEED, end_sample, end_sample + width)
             else:
-                line.set_data([], [])
-
-        return has_data, global_min_y, global_max_y
+                advise(fd, FADV_WILLNEED, start_sample - width, start_sample)
+
+        # Show markers if zooming in enough (step must be 1 to show true samples)
+        want_marker = step == 1 and safe_end - start_sample < self.marker_max_samples
+
+        return extremes, (x_start, x_step, step > 1), y_data, want_marker
+
+    def x_axis(self, x_start, x_step, pairs, count):
+        """X values for 'count' points starting at x_start, x_step apart.
+
+        Every line in a view starts at the same sample with the same step,
+        they just end at different places, so the buffer is only rebuilt
+        when the grid changes or a line needs more of it than was built.
+        With pairs, each x is repeated for the min/max points of a bucket.
+        """
+        key = (x_start, x_step, pairs)
+        if key != self.x_key or count > self.x_count:
+            # In-place generation of sample axis: scale the pre-calculated
+            # indices 0..N-1 straight into the buffer, then add the start.
+            # For min/max pairs only the bucket starts get computed, the
+            # second point of each pair is a copy.
+            target_buffer = self.x_buffer[:count]
+            if pairs:
+                starts = target_buffer[0::2]
+                np.multiply(self.index_buffer[:starts.size], x_step, out=starts)
+                starts += x_start
+                target_buffer[1::2] = starts
+            else:
+                np.multiply(self.index_buffer[:count], x_step, out=target_buffer)
+                target_buffer += x_start
+            self.x_key = key
+            self.x_count = count
+        return self.x_buffer[:count]
 
     def update_view(self, start_sample, width_samples):
         """Core update logic: loads data and sets limits (Constrained Mode)."""
@@ -314,13 +836,21 @@ class WaveformVisualizer:
             # Clamp start time
             start_sample = max(0, min(start_sample, self.max_samples))
 
-            has_data, min_y, max_y = self.get_chunk(start_sample, width_samples)
+            # Wide views just use the precomputed whole-file peak
+            wide = width_samples > WIDE_VIEW_SEC * self.rate
+            has_data, min_y, max_y = self.get_chunk(start_sample, width_samples, compute_minmax=not wide)
+            if wide:
+                max_y = max((m for m in self.file_abs_max if m is not None), default=0)
+                min_y = -max_y
 
             # IMPORTANT: Set limits on the MAIN axes, explicitly using self.ax
             self.ax.set_xlim(start_sample, start_sample + width_samples)
 
             # Tight Y-axis scaling logic
-            if has_data and max_y > min_y:
+            if self._y_locked:
+                # Keep the user's rectangle-zoom Y range while panning
+                pass
+            elif has_data and max_y > min_y:
                 # Symmetric zoom centered at 0
                 max_val = max(abs(min_y), abs(max_y))
                 min_val = 1670000 # very approximately 1.1mV
@@ -330,15 +860,53 @@ class WaveformVisualizer:
                 else:
                     max_val *= 1.05
 
-                self.ax.set_ylim(-max_val, max_val)
+                self.set_ylim_lazy(-max_val, max_val)
             else:
                  # Default fallback if no data (-1.0 to 1.0 equivalent)
-                 self.ax.set_ylim(-2147483648, 2147483648)
+                 self.set_ylim_lazy(-2147483648, 2147483648)
 
-            self.fig.canvas.draw_idle()
+            self.redraw()
         finally:
             self.navigating = False
 
+    def on_draw(self, event):
+        """After a full draw: save the background and paint the lines on it."""
+        canvas = self.fig.canvas
+        saving = canvas.is_saving()
+        if not saving:
+            self.background = canvas.copy_from_bbox(self.ax.bbox)
+            self.background_lims = (self.ax.get_xlim(), self.ax.get_ylim())
+            self.legend_pixels = canvas.copy_from_bbox(self.legend.get_window_extent().padded(1))
+        for line in self.lines:
+            line.draw(event.renderer)
+        if saving:
+            self.legend.draw(event.renderer)
+        else:
+            canvas.restore_region(self.legend_pixels)
+
+    def redraw(self):
+        """Show updated line data, blitting over the saved background if we can."""
+        if self.background is None or self.background_lims != (self.ax.get_xlim(), self.ax.get_ylim()):
+            # Limits moved, so ticks and grid need a real redraw
+            self.fig.canvas.draw_idle()
+            return
+
+        self.fig.canvas.restore_region(self.background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        # A copy of the legend's pixels, no need to lay it out again
+        self.fig.canvas.restore_region(self.legend_pixels)
+        self.fig.canvas.blit(self.ax.bbox)
+
+    def set_ylim_lazy(self, y_min, y_max):
+        """Set Y limits, unless both ends are already within YLIM_HYSTERESIS."""
+        cur_min, cur_max = self.ax.get_ylim()
+        if cur_min and cur_max:
+            if (abs(y_min / cur_min - 1) < YLIM_HYSTERESIS and
+                abs(y_max / cur_max - 1) < YLIM_HYSTERESIS):
+                return
+        self.ax.set_ylim(y_min, y_max)
+
     def update_slider_text(self, val):
         """Helper to update slider texts (Width and End Point)."""
         start_val, end_val = val
@@ -375,7 +943,54 @@ class WaveformVisualizer:
         # Fallback for init
         if width_samples <= 0: width_samples = INITIAL_WINDOW_SEC * self.rate
 
-        self.update_view(start_sample, width_samples)
+        self.schedule_update(self.update_view, start_sample, width_samples)
+
+    def schedule_update(self, func, *args):
+        """Run func(*args) on the next update timer tick, replacing anything pending."""
+        if self.pending is None:
+            self.update_timer.start()
+        self.pending = (func, args)
+
+    def flush_update(self):
+        """Update timer callback: run the latest pending update."""
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            func, args = pending
+            func(*args)
+
+    def reload(self):
+        """Reload the line data for the current X limits (no Y rescaling).
+
+        The data is computed on the loader thread and applied by poll().
+        """
+        if self.future is not None:
+            # Still busy; poll() starts another load when this one is done
+            self.reload_pending = True
+            return
+        xlim = self.ax.get_xlim()
+        self.future = self.loader.submit(self.compute_chunk, xlim[0], xlim[1] - xlim[0],
+                                          compute_minmax=False)
+        self.poll_timer.start()
+
+    def poll(self):
+        """Poll timer callback: apply a finished background load."""
+        if self.future is None:
+            self.poll_timer.stop()
+            return
+        if not self.future.done():
+            return
+
+        future, self.future = self.future, None
+        _, _, _, updates = future.result()
+        self.apply_chunk(updates)
+        self.redraw()
+
+        if self.reload_pending:
+            # The view moved again while we were loading
+            self.reload_pending = False
+            self.reload()
+        else:
+            self.poll_timer.stop()
 
     def on_scroll(self, event):
         """Handle zoom."""
@@ -410,6 +1025,29 @@ class WaveformVisualizer:
              self.slider.set_val((new_start, new_start + new_width))
              self.update_slider_text((new_start, new_start + new_width))
 
+    def sync_slider(self, start_sample, end_sample):
+        """Silently move the slider to match the plot limits."""
+        if not hasattr(self, 'slider'):
+            return
+
+        if self.x_mode == 'Time':
+            s, e = start_sample / self.rate, end_sample / self.rate
+        else:
+            s, e = start_sample, end_sample
+
+        # set_val redraws the whole slider, so skip it for moves of less
+        # than a pixel that nobody could see anyway
+        pixel = (self.slider.valmax - self.slider.valmin) / self.slider.ax.bbox.width
+        old_s, old_e = self.slider.val
+        if abs(s - old_s) >= pixel or abs(e - old_e) >= pixel:
+            old_eventson = self.slider.eventson
+            self.slider.eventson = False
+            self.slider.set_val((s, e))
+            self.slider.eventson = old_eventson
+
+        # set_val resets the text to its own format, so always write ours
+        self.update_slider_text((s, e))
+
     def on_xlim_changed(self, ax):
         """Handle external xlim changes (e.g. from Toolbar). Unconstrained load."""
         if self.navigating: return
@@ -419,23 +1057,13 @@ class WaveformVisualizer:
             start_sample = xlim[0]
             width = xlim[1] - xlim[0]
 
-            # Reload data (No constraints)
-            self.get_chunk(start_sample, width)
+            # Zooming in within what's loaded needs no new data, matplotlib
+            # just clips the existing lines. Otherwise reload (No constraints)
+            # on the next timer tick.
+            if not self.is_loaded(start_sample, start_sample + width):
+                self.schedule_update(self.reload)
 
-            # Sync slider silently
-            # Sync slider silently
-            if hasattr(self, 'slider'):
-                old_eventson = self.slider.eventson
-                self.slider.eventson = False
-
-                if self.x_mode == 'Time':
-                    s = start_sample / self.rate
-                    e = (start_sample + width) / self.rate
-                    self.slider.set_val((s, e))
-                else:
-                    self.slider.set_val((start_sample, start_sample + width))
-
-                self.slider.eventson = old_eventson
+            self.sync_slider(start_sample, start_sample + width)
         finally:
             self.navigating = False
 
@@ -489,34 +1117,18 @@ class WaveformVisualizer:
                 changed = True
 
             if changed:
-                # Reload data for new X view
-                # We need new xlim
+                # Reload data for new X view; key repeats get coalesced
                 new_xlim = self.ax.get_xlim()
-                self.get_chunk(new_xlim[0], new_xlim[1] - new_xlim[0])
-
-                # Sync slider silently
-                if hasattr(self, 'slider'):
-                    old_eventson = self.slider.eventson
-                    self.slider.eventson = False
-
-                    if self.x_mode == 'Time':
-                        s = new_xlim[0] / self.rate
-                        e = new_xlim[1] / self.rate
-                        self.slider.set_val((s, e))
-                        self.update_slider_text((s, e))
-                    else:
-                        self.slider.set_val((new_xlim[0], new_xlim[1]))
-                        self.update_slider_text((new_xlim[0], new_xlim[1]))
-
-                    self.slider.eventson = old_eventson
+                self.schedule_update(self.reload)
 
-                self.fig.canvas.draw_idle()
+                self.sync_slider(new_xlim[0], new_xlim[1])
 
         finally:
              self.navigating = False
 
         # Space Bar (Reset Zoom) - Only reset Y axis to fit visible data (Auto-scale)
         if event.key == ' ':
+            self._y_locked = False
             xlim = self.ax.get_xlim()
             width = xlim[1] - xlim[0]
             self.update_view(xlim[0], width)
@@ -560,14 +1172,16 @@ class WaveformVisualizer:
 
         # So let's set limits directly, similar to on_scroll/on_key, but for both axes.
 
-        if self.navigating: return
         self.navigating = True
         try:
              # X Axis Logic
              new_width = max(self.min_zoom_samples, min(width, self.max_samples))
              # If user selected < min width, we centered it above.
 
-             self.get_chunk(start_sample, new_width)
+             # The Y limits come from the rectangle, so skip the min/max.
+             # set_xlim() calls on_xlim_changed() right away, and the
+             # navigating flag keeps it from loading the same view again.
+             self.get_chunk(start_sample, new_width, compute_minmax=False)
 
              self.ax.set_xlim(start_sample, start_sample + new_width)
 
@@ -576,30 +1190,18 @@ class WaveformVisualizer:
              y_max = max(y1, y2)
 
              self.ax.set_ylim(y_min, y_max)
+             self._y_locked = True
 
-             self.fig.canvas.draw_idle()
-
-             if hasattr(self, 'slider'):
-                 old_eventson = self.slider.eventson
-                 self.slider.eventson = False
-
-                 if self.x_mode == 'Time':
-                     s = start_sample / self.rate
-                     e = (start_sample + new_width) / self.rate
-                     self.slider.set_val((s, e))
-                     self.update_slider_text((s, e))
-                 else:
-                     self.slider.set_val((start_sample, start_sample + new_width))
-                     self.update_slider_text((start_sample, start_sample + new_width))
+             self.redraw()
 
-                 self.slider.eventson = old_eventson
+             self.sync_slider(start_sample, start_sample + new_width)
 
         finally:
             self.navigating = False
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Linux Audio Waveform Visualizer 2026 (mmap)")
+    parser = argparse.ArgumentParser(description="Linux Audio Waveform Visualizer 2026")
     parser.add_argument('files', nargs='+', help="Input .bin files (int32)")
     parser.add_argument('--rate', type=int, default=48000, help="Sample rate (Hz)")
     parser.add_argument('--min-zoom-samples', type=int, default=100, help="Minimum samples to show when zoomed in")
@@ -0,0 +1,87 @@
+/*
+ * Tiny helper library for visualize.py, loaded with ctypes.
+ *
+ * Build with "make wavekernel.so".  The visualizer falls back to
+ * plain numpy if it isn't there, it's just slower for big windows.
+ */
+#include <stddef.h>
+#include <stdint.h>
+
+/*
+ * Reduce 'n' samples into buckets of 'bucket' samples each, writing
+ * the minimum and maximum of every bucket.  The last bucket may be
+ * partial.  Returns the number of buckets written.
+ *
+ * This is one pass over the data, and the inner loop is a plain
+ * min/max reduction that gcc happily vectorizes at -O3.
+ */
+size_t bucket_minmax_i32(const int32_t *src, size_t n, size_t bucket,
+			 int32_t *out_min, int32_t *out_max)
+{
+	size_t nr = 0;
+
+	while (n) {
+		size_t len = n < bucket ? n : bucket;
+		int32_t lo = src[0], hi = src[0];
+
+		for (size_t i = 1; i < len; i++) {
+			int32_t v = src[i];
+			lo = v < lo ? v : lo;
+			hi = v > hi ? v : hi;
+		}
+		out_min[nr] = lo;
+		out_max[nr] = hi;
+		nr++;
+		src += len;
+		n -= len;
+	}
+	return nr;
+}
+
+/*
+ * Copy 'n' samples to 'out' as doubles (which is what matplotlib
+ * wants anyway), and get their minimum and maximum in the same pass
+ * instead of walking the data three times.
+ */
+void scan_i32(const int32_t *src, size_t n, double *out, int32_t *minmax)
+{
+	int32_t lo = src[0], hi = src[0];
+
+	for (size_t i = 0; i < n; i++) {
+		int32_t v = src[i];
+		out[i] = v;
+		lo = v < lo ? v : lo;
+		hi = v > hi ? v : hi;
+	}
+	minmax[0] = lo;
+	minmax[1] = hi;
+}
+
+/*
+ * bucket_minmax_i32() for the pyramid, which only stores the top 16
+ * bits of every minimum and maximum.  Writing those directly saves
+ * building full int32 arrays for the whole file just to shift them
+ * down and copy them to int16 afterwards.
+ */
+size_t bucket_minmax_top16(const int32_t *src, size_t n, size_t bucket,
+			   int16_t *out_min, int16_t *out_max)
+{
+	size_t nr = 0;
+
+	while (n) {
+		size_t len = n < bucket ? n : bucket;
+		int32_t lo = src[0], hi = src[0];
+
+		for (size_t i = 1; i < len; i++) {
+			int32_t v = src[i];
+			lo = v < lo ? v : lo;
+			hi = v > hi ? v : hi;
+		}
+		out_min[nr] = lo >> 16;
+		out_max[nr] = hi >> 16;
+		nr++;
+		src += len;
+		n -= len;
+	}
+	return nr;
+}